@@ -1,11 +1,19 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Body, Request
+from fastapi.responses import ORJSONResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
 import os
+import time
+import hashlib
+import orjson
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import List, Optional
 from datetime import datetime
 
@@ -13,13 +21,38 @@ from datetime import datetime
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Logging is configured by the launcher, not on import
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+logger = logging.getLogger(__name__)
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=100,
+    minPoolSize=10,
+    maxIdleTimeMS=30000,
+    serverSelectionTimeoutMS=3000,
+)
 db = client[os.environ['DB_NAME']]
+books_col = db.books
+progress_col = db.progress
+
+# Redis cache connection
+redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+cache = aioredis.from_url(
+    redis_url,
+    socket_connect_timeout=0.25,
+    socket_timeout=0.25,
+)
+BOOKS_CACHE_TTL = 3600  # seconds
+PROGRESS_CACHE_TTL = 300  # seconds
+CACHE_RETRY_DELAY = 30  # seconds to bypass Redis after a failure
+cache_down_until = 0.0
+cache_pending_deletes = set()  # keys whose invalidation has not reached Redis yet
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -50,6 +83,9 @@ class PlaybackProgressUpdate(BaseModel):
     duration: float
     current_file_index: int
 
+class LibraryEntry(Book):
+    progress: Optional[PlaybackProgress] = None
+
 class BookCreate(BaseModel):
     id: str
     title: str
@@ -59,6 +95,166 @@ class BookCreate(BaseModel):
     series_name: Optional[str] = None
     file_count: int = 0
 
+# MongoDB projections - fetch only the fields the response models use
+BOOK_PROJECTION = {"_id": 0, **{field: 1 for field in Book.model_fields}}
+PROGRESS_PROJECTION = {"_id": 0, **{field: 1 for field in PlaybackProgress.model_fields}}
+LIBRARY_PROJECTION = {
+    **BOOK_PROJECTION,
+    **{f"progress.{field}": 1 for field in PlaybackProgress.model_fields},
+}
+CURSOR_BATCH_SIZE = 200
+BULK_MAX_BOOKS = 1000
+
+# Returned for books that have no saved progress yet
+DEFAULT_PROGRESS = {
+    "position": 0.0,
+    "duration": 0.0,
+    "current_file_index": 0,
+    "completed": False
+}
+
+# Compiled validators - validate and serialize a document or result set in one pass
+BOOK = TypeAdapter(Book)
+BOOK_LIST = TypeAdapter(List[Book])
+PROGRESS = TypeAdapter(PlaybackProgress)
+PROGRESS_LIST = TypeAdapter(List[PlaybackProgress])
+
+# Aggregation helpers
+def build_pipeline(join, project, match=None, sort=None, skip=0, limit=0):
+    """Assemble stages as $match, $sort, $skip, $limit, join stages, $project.
+
+    $match/$sort/$limit must stay adjacent so MongoDB can answer them with an
+    index-backed top-K; a $project between them forces a full scan.
+    """
+    pipeline = []
+    if match:
+        pipeline.append({"$match": match})
+    if sort:
+        pipeline.append({"$sort": sort})
+    if skip:
+        pipeline.append({"$skip": skip})
+    if limit:
+        pipeline.append({"$limit": limit})
+    pipeline.extend(join)
+    pipeline.append({"$project": project})
+    return pipeline
+
+def library_pipeline(match=None, skip=0, limit=0):
+    """Books in insertion order, each joined with its progress (or null)"""
+    return build_pipeline(
+        match=match,
+        sort={"_id": 1},
+        skip=skip,
+        limit=limit,
+        join=[
+            {"$lookup": {
+                "from": "progress",
+                "localField": "id",
+                "foreignField": "book_id",
+                "as": "progress",
+            }},
+            {"$unwind": {"path": "$progress", "preserveNullAndEmptyArrays": True}},
+        ],
+        project=LIBRARY_PROJECTION,
+    )
+
+def recent_pipeline(limit):
+    """Most recently played progress entries, reshaped into library entries"""
+    return build_pipeline(
+        sort={"last_played": -1},
+        limit=limit,
+        join=[
+            {"$lookup": {
+                "from": "books",
+                "localField": "book_id",
+                "foreignField": "id",
+                "as": "book",
+            }},
+            {"$unwind": "$book"},
+            {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$book", {"progress": "$$ROOT"}]}}},
+        ],
+        project=LIBRARY_PROJECTION,
+    )
+
+# Response helpers
+def json_response(body: bytes) -> Response:
+    """Wrap an already-encoded JSON body, bypassing response_model processing"""
+    return Response(content=body, media_type="application/json")
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison per RFC 9110: W/ prefixes are ignored and * matches any tag"""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+def etag_response(request: Request, body: bytes) -> Response:
+    """Return body with an ETag, or 304 Not Modified if the client already has it"""
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response = json_response(body)
+    response.headers["ETag"] = etag
+    return response
+
+# Cache helpers - values are encoded JSON response bodies;
+# Redis failures fall back to MongoDB
+def cache_available() -> bool:
+    """False while reads and writes are bypassing Redis after a failure"""
+    return time.monotonic() >= cache_down_until
+
+def cache_failed(op: str, key, e: RedisError):
+    """Bypass Redis for CACHE_RETRY_DELAY, logging only when the bypass starts"""
+    global cache_down_until
+    if cache_available():
+        logger.warning(
+            "Redis %s %s failed, bypassing cache for %ss: %s",
+            op, key, CACHE_RETRY_DELAY, e
+        )
+    cache_down_until = time.monotonic() + CACHE_RETRY_DELAY
+
+async def cache_flush_deletes() -> bool:
+    """Replay outstanding invalidations; False while Redis still rejects them"""
+    if not cache_pending_deletes:
+        return True
+    keys = tuple(cache_pending_deletes)
+    try:
+        await cache.delete(*keys)
+    except RedisError as e:
+        cache_failed("DEL", keys, e)
+        return False
+    cache_pending_deletes.difference_update(keys)
+    return True
+
+async def cache_get(key: str) -> Optional[bytes]:
+    """Return the cached body for key, or None on miss"""
+    # Cached bodies are not trusted until every failed invalidation has landed
+    if not cache_available() or not await cache_flush_deletes():
+        return None
+    try:
+        return await cache.get(key)
+    except RedisError as e:
+        cache_failed("GET", key, e)
+        return None
+
+async def cache_set(key: str, body: bytes, ttl: int):
+    """Store an encoded body under key with a TTL"""
+    if not cache_available() or not await cache_flush_deletes():
+        return
+    try:
+        await cache.setex(key, ttl, body)
+    except RedisError as e:
+        cache_failed("SETEX", key, e)
+
+async def cache_delete(*keys: str):
+    """Invalidate one or more cache keys"""
+    # Queued first and always attempted, even while bypassing: a failed DEL
+    # stays queued and is replayed before any cached body is served again
+    cache_pending_deletes.update(keys)
+    await cache_flush_deletes()
+
 # Routes
 @api_router.get("/")
 async def root():
@@ -67,110 +263,259 @@ async def root():
 @api_router.post("/books")
 async def create_book(book: BookCreate):
     """Create or update a book entry"""
-    existing = await db.books.find_one({"id": book.id})
-    book_dict = book.dict()
-    book_dict["created_at"] = datetime.utcnow()
+    await books_col.update_one(
+        {"id": book.id},
+        {"$set": book.model_dump(), "$currentDate": {"created_at": True}},
+        upsert=True
+    )
+    
+    await cache_delete("books:all", f"books:{book.id}")
+    return {"status": "success", "book_id": book.id}
+
+@api_router.post("/books/bulk")
+async def create_books_bulk(books: List[BookCreate] = Body(..., max_length=BULK_MAX_BOOKS)):
+    """Create or update many book entries in a single write"""
+    if not books:
+        return {"status": "success", "book_ids": []}
     
-    if existing:
-        await db.books.update_one(
-            {"id": book.id},
-            {"$set": book_dict}
+    try:
+        await books_col.bulk_write(
+            [
+                UpdateOne(
+                    {"id": book.id},
+                    {"$set": book.model_dump(), "$currentDate": {"created_at": True}},
+                    upsert=True
+                )
+                for book in books
+            ],
+            ordered=False
         )
-    else:
-        await db.books.insert_one(book_dict)
+    except BulkWriteError as e:
+        # Unordered: every write without an error entry was still applied
+        failed = {err["index"]: err["errmsg"] for err in e.details.get("writeErrors", [])}
+        return ORJSONResponse(status_code=207, content={
+            "status": "partial",
+            "book_ids": [book.id for i, book in enumerate(books) if i not in failed],
+            "failed": [{"book_id": books[i].id, "error": msg} for i, msg in failed.items()],
+        })
+    finally:
+        await cache_delete("books:all", *(f"books:{book.id}" for book in books))
     
-    return {"status": "success", "book_id": book.id}
+    return {"status": "success", "book_ids": [book.id for book in books]}
 
 @api_router.get("/books", response_model=List[Book])
-async def get_books():
-    """Get all books"""
-    books = await db.books.find().to_list(1000)
-    return [Book(**book) for book in books]
+async def get_books(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(0, ge=0),
+    is_series: Optional[bool] = None,
+):
+    """Get books, optionally filtered and paginated (limit=0 returns all)"""
+    query = {}
+    if is_series is not None:
+        query["is_series"] = is_series
+    
+    # Only the full library listing is cached
+    cacheable = not query and skip == 0 and limit == 0
+    if cacheable:
+        cached = await cache_get("books:all")
+        if cached is not None:
+            return etag_response(request, cached)
+    
+    cursor = (
+        books_col.find(query, BOOK_PROJECTION, batch_size=CURSOR_BATCH_SIZE)
+        .sort("_id", 1)
+        .skip(skip)
+        .limit(limit)
+    )
+    books = BOOK_LIST.validate_python([book async for book in cursor])
+    body = BOOK_LIST.dump_json(books)
+    if cacheable:
+        await cache_set("books:all", body, BOOKS_CACHE_TTL)
+    return etag_response(request, body)
 
 @api_router.get("/books/{book_id}", response_model=Book)
 async def get_book(book_id: str):
     """Get a specific book"""
-    book = await db.books.find_one({"id": book_id})
+    cached = await cache_get(f"books:{book_id}")
+    if cached is not None:
+        return json_response(cached)
+    
+    book = await books_col.find_one({"id": book_id}, BOOK_PROJECTION)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
-    return Book(**book)
+    body = BOOK.dump_json(BOOK.validate_python(book))
+    await cache_set(f"books:{book_id}", body, BOOKS_CACHE_TTL)
+    return json_response(body)
+
+@api_router.post("/books/batch", response_model=List[Book])
+async def get_books_batch(ids: List[str] = Body(..., max_length=BULK_MAX_BOOKS)):
+    """Get several books by id in a single query"""
+    cursor = books_col.find({"id": {"$in": ids}}, BOOK_PROJECTION, batch_size=CURSOR_BATCH_SIZE)
+    return [book async for book in cursor]
+
+@api_router.get("/library", response_model=List[LibraryEntry])
+async def get_library(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(0, ge=0),
+    is_series: Optional[bool] = None,
+):
+    """Get books joined with their playback progress (limit=0 returns all)"""
+    match = {}
+    if is_series is not None:
+        match["is_series"] = is_series
+    
+    pipeline = library_pipeline(match=match, skip=skip, limit=limit)
+    cursor = books_col.aggregate(pipeline, batchSize=CURSOR_BATCH_SIZE)
+    return [entry async for entry in cursor]
+
+@api_router.get("/library/recent", response_model=List[LibraryEntry])
+async def get_recently_played(limit: int = Query(10, ge=1, le=100)):
+    """Get the most recently played books with their playback progress"""
+    pipeline = recent_pipeline(limit)
+    cursor = progress_col.aggregate(pipeline, batchSize=CURSOR_BATCH_SIZE)
+    return [entry async for entry in cursor]
 
 @api_router.post("/progress")
 async def save_progress(progress: PlaybackProgressUpdate):
     """Save playback progress for a book"""
-    existing = await db.progress.find_one({"book_id": progress.book_id})
-    
-    progress_dict = progress.dict()
-    progress_dict["last_played"] = datetime.utcnow()
+    progress_dict = progress.model_dump()
     progress_dict["completed"] = False
     
-    if existing:
-        await db.progress.update_one(
-            {"book_id": progress.book_id},
-            {"$set": progress_dict}
-        )
-    else:
-        await db.progress.insert_one(progress_dict)
+    await progress_col.update_one(
+        {"book_id": progress.book_id},
+        {"$set": progress_dict, "$currentDate": {"last_played": True}},
+        upsert=True
+    )
     
+    await cache_delete(f"progress:{progress.book_id}")
     return {"status": "success"}
 
 @api_router.get("/progress/{book_id}")
-async def get_progress(book_id: str):
+async def get_progress(request: Request, book_id: str):
     """Get playback progress for a book"""
-    progress = await db.progress.find_one({"book_id": book_id})
+    cached = await cache_get(f"progress:{book_id}")
+    if cached is not None:
+        return etag_response(request, cached)
+    
+    progress = await progress_col.find_one({"book_id": book_id}, PROGRESS_PROJECTION)
     if not progress:
-        return {
-            "book_id": book_id,
-            "position": 0.0,
-            "duration": 0.0,
-            "current_file_index": 0,
-            "completed": False
-        }
-    return PlaybackProgress(**progress)
+        return etag_response(request, orjson.dumps({"book_id": book_id, **DEFAULT_PROGRESS}))
+    body = PROGRESS.dump_json(PROGRESS.validate_python(progress))
+    await cache_set(f"progress:{book_id}", body, PROGRESS_CACHE_TTL)
+    return etag_response(request, body)
 
 @api_router.get("/progress", response_model=List[PlaybackProgress])
-async def get_all_progress():
-    """Get all playback progress"""
-    progress_list = await db.progress.find().to_list(1000)
-    return [PlaybackProgress(**p) for p in progress_list]
+async def get_all_progress(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(0, ge=0),
+    completed: Optional[bool] = None,
+):
+    """Get playback progress, optionally filtered and paginated (limit=0 returns all)"""
+    query = {}
+    if completed is not None:
+        query["completed"] = completed
+    
+    cursor = (
+        progress_col.find(query, PROGRESS_PROJECTION, batch_size=CURSOR_BATCH_SIZE)
+        .sort("_id", 1)
+        .skip(skip)
+        .limit(limit)
+    )
+    progress_list = PROGRESS_LIST.validate_python([p async for p in cursor])
+    return json_response(PROGRESS_LIST.dump_json(progress_list))
 
 @api_router.delete("/progress/{book_id}")
 async def reset_progress(book_id: str):
     """Reset playback progress for a book"""
-    result = await db.progress.delete_one({"book_id": book_id})
+    result = await progress_col.delete_one({"book_id": book_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Progress not found")
+    await cache_delete(f"progress:{book_id}")
     return {"status": "success", "message": "Progress reset"}
 
 @api_router.post("/progress/complete/{book_id}")
 async def mark_complete(book_id: str):
     """Mark a book as completed"""
-    result = await db.progress.update_one(
+    result = await progress_col.update_one(
         {"book_id": book_id},
-        {"$set": {"completed": True, "last_played": datetime.utcnow()}}
+        {"$set": {"completed": True}, "$currentDate": {"last_played": True}}
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Progress not found")
+    await cache_delete(f"progress:{book_id}")
     return {"status": "success"}
 
-# Include the router in the main app
-app.include_router(api_router)
+# Only the app's own frontends may call the API from a browser
+cors_origins = os.environ.get(
+    'CORS_ORIGINS',
+    'https://listen-smart-app.preview.emergentagent.com,http://localhost:8081'
+)
 
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
-    allow_origins=["*"],
+    allow_origins=[origin.strip() for origin in cors_origins.split(',') if origin.strip()],
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+# Include the router in the main app
+app.include_router(api_router)
+
+@app.on_event("startup")
+async def create_indexes():
+    # Collections written before the upserts may already hold duplicate
+    # ids; a unique index then cannot be built. Log it and keep serving
+    # (lookups fall back to collection scans) rather than abort startup.
+    for collection, keys, options in (
+        (books_col, "id", {"unique": True}),
+        (progress_col, "book_id", {"unique": True}),
+        (progress_col, [("last_played", -1)], {}),
+    ):
+        try:
+            await collection.create_index(keys, **options)
+        except OperationFailure as e:
+            logger.error(
+                "Could not create index %s on %s, remove duplicate documents and restart: %s",
+                keys, collection.name, e
+            )
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    await cache.aclose()
+
+def default_workers() -> int:
+    """Number of CPUs this process may run on"""
+    # sched_getaffinity honours container CPU pinning, unlike os.cpu_count(),
+    # but only exists on Linux
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+if __name__ == "__main__":
+    import uvicorn
+    from uvicorn.config import LOGGING_CONFIG
+    
+    # uvicorn applies log_config in every worker process
+    log_config = {
+        **LOGGING_CONFIG,
+        "formatters": {**LOGGING_CONFIG["formatters"], "app": {"format": LOG_FORMAT}},
+        "handlers": {
+            **LOGGING_CONFIG["handlers"],
+            "app": {"class": "logging.StreamHandler", "formatter": "app", "stream": "ext://sys.stderr"},
+        },
+        "root": {"level": "INFO", "handlers": ["app"]},
+    }
+    
+    uvicorn.run(
+        "server:app",
+        app_dir=str(ROOT_DIR),
+        host=os.environ.get("HOST", "0.0.0.0"),
+        port=int(os.environ.get("PORT", "8001")),
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WEB_CONCURRENCY") or default_workers()),
+        log_config=log_config,
+    )
@@ -4,7 +4,8 @@ Smart Audiobook Player Backend API Test Suite
 Tests all backend endpoints with realistic audiobook data
 """
 
-import requests
+import asyncio
+import httpx
 import json
 import sys
 from datetime import datetime
@@ -32,11 +33,7 @@ TEST_PROGRESS_DATA = {
 
 class APITester:
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        })
+        self.client = None
         self.results = []
         
     def log_result(self, test_name, success, message, response_data=None):
@@ -51,10 +48,10 @@ class APITester:
             "response_data": response_data
         })
         
-    def test_health_check(self):
+    async def test_health_check(self):
         """Test GET /api/ - Health check endpoint"""
         try:
-            response = self.session.get(f"{BACKEND_URL}/")
+            response = await self.client.get(f"{BACKEND_URL}/")
             
             if response.status_code == 200:
                 data = response.json()
@@ -68,10 +65,10 @@ class APITester:
         except Exception as e:
             self.log_result("Health Check", False, f"Connection error: {str(e)}")
     
-    def test_create_book(self):
+    async def test_create_book(self):
         """Test POST /api/books - Create audiobook"""
         try:
-            response = self.session.post(f"{BACKEND_URL}/books", json=TEST_BOOK_DATA)
+            response = await self.client.post(f"{BACKEND_URL}/books", json=TEST_BOOK_DATA)
             
             if response.status_code == 200:
                 data = response.json()
@@ -85,10 +82,10 @@ class APITester:
         except Exception as e:
             self.log_result("Create Book", False, f"Request error: {str(e)}")
     
-    def test_get_all_books(self):
+    async def test_get_all_books(self):
         """Test GET /api/books - Get all books"""
         try:
-            response = self.session.get(f"{BACKEND_URL}/books")
+            response = await self.client.get(f"{BACKEND_URL}/books")
             
             if response.status_code == 200:
                 data = response.json()
@@ -107,10 +104,31 @@ class APITester:
         except Exception as e:
             self.log_result("Get All Books", False, f"Request error: {str(e)}")
     
-    def test_get_specific_book(self):
+    async def test_conditional_get_books(self):
+        """Test GET /api/books with If-None-Match - Conditional GET returns 304"""
+        try:
+            response = await self.client.get(f"{BACKEND_URL}/books")
+            etag = response.headers.get("etag")
+            if response.status_code != 200 or not etag:
+                self.log_result("Conditional Get Books", False, f"Expected 200 with ETag, got HTTP {response.status_code}, ETag {etag!r}")
+                return
+            
+            # A weak validator for the same body must match too
+            for sent in (etag, f"W/{etag}"):
+                response = await self.client.get(f"{BACKEND_URL}/books", headers={"If-None-Match": sent})
+                if response.status_code != 304:
+                    self.log_result("Conditional Get Books", False, f"Expected 304 for If-None-Match {sent}, got HTTP {response.status_code}")
+                    return
+            
+            self.log_result("Conditional Get Books", True, f"Returned 304 for matching ETag {etag}")
+                
+        except Exception as e:
+            self.log_result("Conditional Get Books", False, f"Request error: {str(e)}")
+    
+    async def test_get_specific_book(self):
         """Test GET /api/books/{book_id} - Get specific book"""
         try:
-            response = self.session.get(f"{BACKEND_URL}/books/{TEST_BOOK_DATA['id']}")
+            response = await self.client.get(f"{BACKEND_URL}/books/{TEST_BOOK_DATA['id']}")
             
             if response.status_code == 200:
                 data = response.json()
@@ -124,10 +142,10 @@ class APITester:
         except Exception as e:
             self.log_result("Get Specific Book", False, f"Request error: {str(e)}")
     
-    def test_get_nonexistent_book(self):
+    async def test_get_nonexistent_book(self):
         """Test GET /api/books/{book_id} - Error handling for non-existent book"""
         try:
-            response = self.session.get(f"{BACKEND_URL}/books/nonexistent_book_id")
+            response = await self.client.get(f"{BACKEND_URL}/books/nonexistent_book_id")
             
             if response.status_code == 404:
                 data = response.json()
@@ -141,10 +159,57 @@ class APITester:
         except Exception as e:
             self.log_result("Get Nonexistent Book", False, f"Request error: {str(e)}")
     
-    def test_save_progress(self):
+    async def test_get_books_batch(self):
+        """Test POST /api/books/batch - Get several books by id"""
+        try:
+            ids = [TEST_BOOK_DATA["id"], "nonexistent_book_id"]
+            response = await self.client.post(f"{BACKEND_URL}/books/batch", json=ids)
+            
+            if response.status_code == 200:
+                data = response.json()
+                if isinstance(data, list) and len(data) == 1 and data[0].get("id") == TEST_BOOK_DATA["id"]:
+                    self.log_result("Get Books Batch", True, "Retrieved only the existing book", data)
+                else:
+                    self.log_result("Get Books Batch", False, f"Expected exactly the test book, got: {data}", data)
+            else:
+                self.log_result("Get Books Batch", False, f"HTTP {response.status_code}: {response.text}")
+                
+        except Exception as e:
+            self.log_result("Get Books Batch", False, f"Request error: {str(e)}")
+    
+    async def test_create_books_bulk(self):
+        """Test POST /api/books/bulk - Create several audiobooks in one request"""
+        try:
+            books = [
+                {**TEST_BOOK_DATA, "id": f"{TEST_BOOK_DATA['id']}_bulk_{i}", "title": f"Bulk Audiobook {i}"}
+                for i in range(3)
+            ]
+            ids = [book["id"] for book in books]
+            response = await self.client.post(f"{BACKEND_URL}/books/bulk", json=books)
+            
+            if response.status_code == 200:
+                data = response.json()
+                if data.get("status") != "success" or data.get("book_ids") != ids:
+                    self.log_result("Create Books Bulk", False, f"Unexpected response: {data}", data)
+                    return
+                
+                # The new books must be visible immediately, not hidden by a cached listing
+                verify_response = await self.client.post(f"{BACKEND_URL}/books/batch", json=ids)
+                found = sorted(book.get("id") for book in verify_response.json()) if verify_response.status_code == 200 else []
+                if found == sorted(ids):
+                    self.log_result("Create Books Bulk", True, f"Created {len(ids)} books in one request", data)
+                else:
+                    self.log_result("Create Books Bulk", False, f"Expected books {ids}, found {found}", data)
+            else:
+                self.log_result("Create Books Bulk", False, f"HTTP {response.status_code}: {response.text}")
+                
+        except Exception as e:
+            self.log_result("Create Books Bulk", False, f"Request error: {str(e)}")
+    
+    async def test_save_progress(self):
         """Test POST /api/progress - Save playback progress"""
         try:
-            response = self.session.post(f"{BACKEND_URL}/progress", json=TEST_PROGRESS_DATA)
+            response = await self.client.post(f"{BACKEND_URL}/progress", json=TEST_PROGRESS_DATA)
             
             if response.status_code == 200:
                 data = response.json()
@@ -158,10 +223,10 @@ class APITester:
         except Exception as e:
             self.log_result("Save Progress", False, f"Request error: {str(e)}")
     
-    def test_get_progress(self):
+    async def test_get_progress(self):
         """Test GET /api/progress/{book_id} - Get progress for specific book"""
         try:
-            response = self.session.get(f"{BACKEND_URL}/progress/{TEST_PROGRESS_DATA['book_id']}")
+            response = await self.client.get(f"{BACKEND_URL}/progress/{TEST_PROGRESS_DATA['book_id']}")
             
             if response.status_code == 200:
                 data = response.json()
@@ -176,10 +241,10 @@ class APITester:
         except Exception as e:
             self.log_result("Get Progress", False, f"Request error: {str(e)}")
     
-    def test_get_all_progress(self):
+    async def test_get_all_progress(self):
         """Test GET /api/progress - Get all progress entries"""
         try:
-            response = self.session.get(f"{BACKEND_URL}/progress")
+            response = await self.client.get(f"{BACKEND_URL}/progress")
             
             if response.status_code == 200:
                 data = response.json()
@@ -198,10 +263,54 @@ class APITester:
         except Exception as e:
             self.log_result("Get All Progress", False, f"Request error: {str(e)}")
     
-    def test_mark_complete(self):
+    async def test_get_library(self):
+        """Test GET /api/library - Get books joined with their progress"""
+        try:
+            response = await self.client.get(f"{BACKEND_URL}/library")
+            
+            if response.status_code == 200:
+                data = response.json()
+                if isinstance(data, list):
+                    entry = next((e for e in data if e.get("id") == TEST_BOOK_DATA["id"]), None)
+                    progress = (entry or {}).get("progress") or {}
+                    if entry is None:
+                        self.log_result("Get Library", False, f"Test book not found in {len(data)} entries", {"count": len(data)})
+                    elif progress.get("position") == TEST_PROGRESS_DATA["position"]:
+                        self.log_result("Get Library", True, f"Retrieved {len(data)} entries, test book has progress", entry)
+                    else:
+                        self.log_result("Get Library", False, f"Test book progress not joined: {entry}", entry)
+                else:
+                    self.log_result("Get Library", False, f"Expected list, got: {type(data)}", data)
+            else:
+                self.log_result("Get Library", False, f"HTTP {response.status_code}: {response.text}")
+                
+        except Exception as e:
+            self.log_result("Get Library", False, f"Request error: {str(e)}")
+    
+    async def test_get_recently_played(self):
+        """Test GET /api/library/recent - Get most recently played books"""
+        try:
+            response = await self.client.get(f"{BACKEND_URL}/library/recent", params={"limit": 5})
+            
+            if response.status_code == 200:
+                data = response.json()
+                if isinstance(data, list) and len(data) <= 5:
+                    if any(e.get("id") == TEST_BOOK_DATA["id"] and e.get("progress") for e in data):
+                        self.log_result("Get Recently Played", True, f"Retrieved {len(data)} entries, test book found", {"count": len(data)})
+                    else:
+                        self.log_result("Get Recently Played", False, f"Test book not found in {len(data)} entries", data)
+                else:
+                    self.log_result("Get Recently Played", False, f"Expected at most 5 entries, got: {data}", data)
+            else:
+                self.log_result("Get Recently Played", False, f"HTTP {response.status_code}: {response.text}")
+                
+        except Exception as e:
+            self.log_result("Get Recently Played", False, f"Request error: {str(e)}")
+    
+    async def test_mark_complete(self):
         """Test POST /api/progress/complete/{book_id} - Mark book as complete"""
         try:
-            response = self.session.post(f"{BACKEND_URL}/progress/complete/{TEST_PROGRESS_DATA['book_id']}")
+            response = await self.client.post(f"{BACKEND_URL}/progress/complete/{TEST_PROGRESS_DATA['book_id']}")
             
             if response.status_code == 200:
                 data = response.json()
@@ -209,7 +318,7 @@ class APITester:
                     self.log_result("Mark Complete", True, "Book marked as complete", data)
                     
                     # Verify completion by getting progress
-                    verify_response = self.session.get(f"{BACKEND_URL}/progress/{TEST_PROGRESS_DATA['book_id']}")
+                    verify_response = await self.client.get(f"{BACKEND_URL}/progress/{TEST_PROGRESS_DATA['book_id']}")
                     if verify_response.status_code == 200:
                         verify_data = verify_response.json()
                         if verify_data.get("completed") == True:
@@ -224,10 +333,10 @@ class APITester:
         except Exception as e:
             self.log_result("Mark Complete", False, f"Request error: {str(e)}")
     
-    def test_reset_progress(self):
+    async def test_reset_progress(self):
         """Test DELETE /api/progress/{book_id} - Reset progress"""
         try:
-            response = self.session.delete(f"{BACKEND_URL}/progress/{TEST_PROGRESS_DATA['book_id']}")
+            response = await self.client.delete(f"{BACKEND_URL}/progress/{TEST_PROGRESS_DATA['book_id']}")
             
             if response.status_code == 200:
                 data = response.json()
@@ -235,7 +344,7 @@ class APITester:
                     self.log_result("Reset Progress", True, "Progress reset successfully", data)
                     
                     # Verify reset by getting progress (should return default values)
-                    verify_response = self.session.get(f"{BACKEND_URL}/progress/{TEST_PROGRESS_DATA['book_id']}")
+                    verify_response = await self.client.get(f"{BACKEND_URL}/progress/{TEST_PROGRESS_DATA['book_id']}")
                     if verify_response.status_code == 200:
                         verify_data = verify_response.json()
                         if verify_data.get("position") == 0.0:
@@ -250,10 +359,10 @@ class APITester:
         except Exception as e:
             self.log_result("Reset Progress", False, f"Request error: {str(e)}")
     
-    def test_reset_nonexistent_progress(self):
+    async def test_reset_nonexistent_progress(self):
         """Test DELETE /api/progress/{book_id} - Error handling for non-existent progress"""
         try:
-            response = self.session.delete(f"{BACKEND_URL}/progress/nonexistent_book_id")
+            response = await self.client.delete(f"{BACKEND_URL}/progress/nonexistent_book_id")
             
             if response.status_code == 404:
                 data = response.json()
@@ -267,24 +376,47 @@ class APITester:
         except Exception as e:
             self.log_result("Reset Nonexistent Progress", False, f"Request error: {str(e)}")
     
-    def run_all_tests(self):
-        """Run all API tests in sequence"""
+    async def run_state_tests(self):
+        """Run the tests that build on each other's data, in order"""
+        await self.test_create_book()
+        await asyncio.gather(
+            self.test_get_all_books(),
+            self.test_get_specific_book(),
+            self.test_get_books_batch(),
+            self.test_conditional_get_books(),
+        )
+        await self.test_save_progress()
+        await asyncio.gather(
+            self.test_get_progress(),
+            self.test_get_all_progress(),
+            self.test_get_library(),
+            self.test_get_recently_played(),
+        )
+        await self.test_mark_complete()
+        await self.test_reset_progress()
+        # Changes the library, so it runs after the cached /books checks
+        await self.test_create_books_bulk()
+    
+    async def run_all_tests(self):
+        """Run all API tests, in parallel where they do not depend on each other"""
         print(f"🚀 Starting Smart Audiobook Player API Tests")
         print(f"📡 Backend URL: {BACKEND_URL}")
         print("=" * 60)
         
-        # Test sequence designed to build up data and then test operations
-        self.test_health_check()
-        self.test_create_book()
-        self.test_get_all_books()
-        self.test_get_specific_book()
-        self.test_get_nonexistent_book()
-        self.test_save_progress()
-        self.test_get_progress()
-        self.test_get_all_progress()
-        self.test_mark_complete()
-        self.test_reset_progress()
-        self.test_reset_nonexistent_progress()
+        headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        }
+        async with httpx.AsyncClient(headers=headers, http2=True) as client:
+            self.client = client
+            
+            # Stateless checks run concurrently with the create -> progress chain
+            await asyncio.gather(
+                self.test_health_check(),
+                self.test_get_nonexistent_book(),
+                self.test_reset_nonexistent_progress(),
+                self.run_state_tests(),
+            )
         
         print("=" * 60)
         
@@ -306,7 +438,7 @@ class APITester:
 def main():
     """Main test execution"""
     tester = APITester()
-    success = tester.run_all_tests()
+    success = asyncio.run(tester.run_all_tests())
     
     # Return appropriate exit code
     sys.exit(0 if success else 1)
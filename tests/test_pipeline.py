@@ -0,0 +1,112 @@
+"""
+Aggregation pipeline tests for the library endpoints.
+
+Stage-order checks run anywhere; the explain probes need a reachable
+MongoDB at MONGO_URL and are skipped otherwise.
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+load_dotenv(BACKEND_DIR / ".env")
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+sys.path.insert(0, str(BACKEND_DIR))
+
+import server  # noqa: E402
+
+PUSHDOWN_STAGES = ["$match", "$sort", "$skip", "$limit"]
+JOIN_STAGES = {"$lookup", "$unwind", "$replaceRoot"}
+
+PIPELINES = {
+    "library": server.library_pipeline(match={"is_series": False}, skip=10, limit=20),
+    "library_defaults": server.library_pipeline(),
+    "recent": server.recent_pipeline(10),
+}
+
+
+def stage_names(pipeline):
+    return [next(iter(stage)) for stage in pipeline]
+
+
+@pytest.mark.parametrize("name", PIPELINES)
+def test_pushdown_stages_precede_join(name):
+    names = stage_names(PIPELINES[name])
+    first_join = next(i for i, stage in enumerate(names) if stage in JOIN_STAGES)
+    head = names[:first_join]
+
+    assert head, "pipeline should sort/limit before joining"
+    assert head == [stage for stage in PUSHDOWN_STAGES if stage in head]
+    assert all(stage in JOIN_STAGES for stage in names[first_join:-1])
+
+
+@pytest.mark.parametrize("name", PIPELINES)
+def test_project_is_last(name):
+    names = stage_names(PIPELINES[name])
+
+    assert names[-1] == "$project"
+    assert names.count("$project") == 1
+
+
+def test_library_pipeline_includes_requested_stages():
+    names = stage_names(PIPELINES["library"])
+
+    assert names[:4] == PUSHDOWN_STAGES
+
+
+def test_recent_pipeline_sorts_then_limits():
+    pipeline = PIPELINES["recent"]
+
+    assert pipeline[0] == {"$sort": {"last_played": -1}}
+    assert pipeline[1] == {"$limit": 10}
+
+
+@pytest.fixture(scope="module")
+def mongo_db():
+    mongo = MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=1000)
+    try:
+        mongo.admin.command("ping")
+    except PyMongoError as e:
+        pytest.skip(f"MongoDB not reachable: {e}")
+
+    # Same indexes the app creates on startup
+    asyncio.run(server.create_indexes())
+    yield mongo[os.environ["DB_NAME"]]
+    mongo.close()
+
+
+def plan_stages(node):
+    """Collect every plan stage name from an explain() result"""
+    if isinstance(node, dict):
+        stages = [node["stage"]] if isinstance(node.get("stage"), str) else []
+        for value in node.values():
+            stages.extend(plan_stages(value))
+        return stages
+    if isinstance(node, list):
+        return [stage for item in node for stage in plan_stages(item)]
+    return []
+
+
+@pytest.mark.parametrize("name, collection", [
+    ("library", "books"),
+    ("library_defaults", "books"),
+    ("recent", "progress"),
+])
+def test_pipeline_uses_index(mongo_db, name, collection):
+    explain = mongo_db.command(
+        "explain",
+        {"aggregate": collection, "pipeline": PIPELINES[name], "cursor": {}},
+        verbosity="executionStats",
+    )
+    stages = plan_stages(explain)
+
+    assert "IXSCAN" in stages
+    assert "COLLSCAN" not in stages